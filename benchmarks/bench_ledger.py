@@ -0,0 +1,141 @@
+"""
+Micro-benchmark 3 hot path ledger: cek saldo, /setsaldo, dan persiapan analisis.
+Membandingkan cara lama (DataFrame + scan kolom + regex tiap panggilan) dengan
+utils.schema (normalisasi sekali saat load, di-cache oleh SheetsService.load_ledger_df).
+Kolom "Miss" = cache kosong/basi (normalize_ledger + query), "Hit" = frame dari cache.
+/setsaldo selalu membaca data segar (fresh=True), jadi hanya kolom Miss yang berlaku.
+
+Jalankan dari root project:
+    python -m benchmarks.bench_ledger [jumlah_baris]
+"""
+import sys
+import time
+import random
+import pandas as pd
+
+from utils.schema import CATEGORICAL_COLUMNS, normalize_ledger, hitung_saldo
+
+KANTONGS = ["BCA", "Mandiri", "Gopay", "Tunai", "SeaBank", "ShopeePay", "BRI", "Dana"]
+KATEGORIS = ["Makan", "Transportasi", "Belanja", "Tagihan", "Hiburan", "Lainnya", "Pemasukan"]
+
+def make_records(n, seed=42):
+    """Data mirip hasil get_all_records: sebagian nominal berupa teks berformat."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        harga = rng.randint(1, 500) * 1000
+        records.append({
+            "Tanggal": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "Jam": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            "Tipe": rng.choice(["Masuk", "Keluar", "Keluar", "Keluar"]),
+            "Kantong": rng.choice(KANTONGS),
+            "Nama": f"Item {i}",
+            "Satuan": "x",
+            "Volume": 1,
+            "Harga_Satuan": harga,
+            "Kategori": rng.choice(KATEGORIS),
+            "Harga_Total": f"Rp {harga:,}".replace(",", ".") if i % 10 == 0 else harga,
+        })
+    return records
+
+# --- Cara lama (disalin dari handler sebelum schema layer) ---
+def legacy_cek_saldo(records):
+    df = pd.DataFrame(records)
+    df.columns = [c.lower().strip() for c in df.columns]
+    col_harga = next((c for c in df.columns if 'total' in c or 'amount' in c or 'harga' in c if 'satuan' not in c), None)
+    hasil = {}
+    for k in df['kantong'].unique():
+        if not k: continue
+        df_k = df[df['kantong'] == k].copy()
+        df_k[col_harga] = pd.to_numeric(df_k[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True), errors='coerce').fillna(0)
+        masuk = df_k[df_k['tipe'].str.lower() == 'masuk'][col_harga].sum()
+        keluar = df_k[df_k['tipe'].str.lower() == 'keluar'][col_harga].sum()
+        hasil[k] = masuk - keluar
+    return hasil
+
+def legacy_setsaldo(records, target_kantong):
+    df = pd.DataFrame(records)
+    df.columns = [str(c).lower().strip() for c in df.columns]
+    col_harga = next((c for c in df.columns if 'total' in c or 'amount' in c or 'harga' in c if 'satuan' not in c), None)
+    mask = df['kantong'].astype(str).str.lower() == target_kantong.lower()
+    df_k = df.loc[mask].copy()
+    df_k[col_harga] = pd.to_numeric(df_k[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True), errors='coerce').fillna(0)
+    masuk = df_k[df_k['tipe'].str.lower() == 'masuk'][col_harga].sum()
+    keluar = df_k[df_k['tipe'].str.lower() == 'keluar'][col_harga].sum()
+    return int(masuk - keluar)
+
+def legacy_analisis(records):
+    df = pd.DataFrame(records)
+    df.columns = [str(c).lower().strip() for c in df.columns]
+    if 'tanggal' in df.columns:
+        df['tanggal'] = pd.to_datetime(df['tanggal'], errors='coerce')
+    candidates = [c for c in df.columns if ('total' in c or 'amount' in c or 'harga' in c) and 'satuan' not in c]
+    col_harga = candidates[0] if candidates else df.columns[-1]
+    df[col_harga] = df[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True)
+    df[col_harga] = pd.to_numeric(df[col_harga], errors='coerce').fillna(0)
+    return df
+
+# --- Cara baru: normalisasi sekali saat load, query memakai frame yang sama ---
+def schema_cek_saldo(ledger):
+    df, col_harga = ledger
+    return hitung_saldo(df, col_harga).to_dict()
+
+def schema_setsaldo(ledger, target_kantong):
+    df, col_harga = ledger
+    saldo = hitung_saldo(df, col_harga)
+    return int(saldo[saldo.index.astype(str).str.lower() == target_kantong.lower()].sum())
+
+def schema_analisis(ledger):
+    # Sama seperti handler: salinan dengan kolom kategori kembali ke object
+    df = ledger[0].copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+    return df
+
+def cache_miss(schema_fn, records, *args):
+    """Cache kosong/basi: normalisasi ulang dari data mentah lalu query."""
+    return schema_fn(normalize_ledger(records), *args)
+
+def best_of(fn, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    records = make_records(n)
+    t_build, _ = best_of(pd.DataFrame, records)
+    t_ingest, ledger = best_of(normalize_ledger, records)
+    print(f"Ledger: {n:,} baris")
+    print(f"pd.DataFrame(records): {t_build * 1000:.1f} ms (dibayar kedua cara)")
+    print(f"normalize_ledger (sekali per load): {t_ingest * 1000:.1f} ms")
+    print()
+    print(f"{'Hot path':<12} {'Lama (ms)':>10} {'Miss (ms)':>10} {'Hit (ms)':>10} {'Speedup miss/hit':>18}")
+
+    cases = [
+        ("cek_saldo", legacy_cek_saldo, schema_cek_saldo, "gopay", True),
+        ("setsaldo", legacy_setsaldo, schema_setsaldo, "gopay", False),
+        ("analisis", legacy_analisis, schema_analisis, None, True),
+    ]
+    for name, legacy_fn, schema_fn, kantong, cached in cases:
+        extra = (kantong,) if name == "setsaldo" else ()
+        t_old, r_old = best_of(legacy_fn, records, *extra)
+        t_miss, r_miss = best_of(cache_miss, schema_fn, records, *extra)
+        t_hit, r_hit = best_of(schema_fn, ledger, *extra)
+        if name == "cek_saldo":
+            expected = {k: round(v) for k, v in r_old.items()}
+            assert expected == {k: round(v) for k, v in r_miss.items()} == {k: round(v) for k, v in r_hit.items()}
+        elif name == "setsaldo":
+            assert r_old == r_miss == r_hit
+        if cached:
+            hit, speedup = f"{t_hit * 1000:.1f}", f"{t_old / t_miss:.1f}x / {t_old / t_hit:.1f}x"
+        else:
+            hit, speedup = "-", f"{t_old / t_miss:.1f}x / -"
+        print(f"{name:<12} {t_old * 1000:>10.1f} {t_miss * 1000:>10.1f} {hit:>10} {speedup:>18}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Load generator untuk traffic burst (cth: notif gajian + belasan top-up e-wallet dalam hitungan detik).
+
+Mengirim request konkuren ke `/webhook/macrodroid` (via ASGI, tanpa network) dan
+Update Telegram palsu ke `handle_message`, memakai fake in-process untuk Google Sheets,
+AI provider, dan Telegram Bot (latency & error rate bisa diatur).
+
+Laporan: throughput, latency p50/p95/p99 per jalur, saturasi thread default executor,
+serta baris ganda / hilang di fake sheet.
+
+Jalankan dari root project:
+    python -m benchmarks.loadtest --webhook 200 --telegram 50 --concurrency 50 \\
+        --sheet-latency 0.3 --ai-latency 1.0 --ai-error-rate 0.1
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import datetime
+import contextvars
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+# Harus di-set sebelum modul project di-import (config dibaca saat import)
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:LOADTEST")
+os.environ.setdefault("GOOGLE_API_KEY", "loadtest")
+os.environ.setdefault("GROQ_API_KEY", "loadtest")
+os.environ.setdefault("SHEET_NAME", "LoadTest")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "loadtest_bot.log"))
+os.environ["STATE_DB"] = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "state.db")
+
+HEADER = ["Tanggal", "Jam", "Tipe", "Kantong", "Nama", "Satuan", "Volume", "Harga Satuan", "Kategori", "Harga Total"]
+MARKER_RE = re.compile(r"LT-\d+")
+KANTONGS = ["BCA", "Gopay", "ShopeePay", "Dana", "SeaBank"]
+current_marker = contextvars.ContextVar("current_marker", default=None)
+
+class FakeFault:
+    """Latency & error acak untuk satu dependency palsu."""
+    def __init__(self, latency, jitter, error_rate, rng):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = rng
+
+    def delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def maybe_fail(self, what):
+        if self.rng.random() < self.error_rate:
+            raise Exception(f"Injected {what} error")
+
+class FakeWorksheet:
+    """Pengganti gspread Worksheet (dipanggil via asyncio.to_thread, jadi latency memakai time.sleep)."""
+    def __init__(self, name, fault):
+        self.name = name
+        self.fault = fault
+        self.rows = [list(HEADER)]
+        self._lock = threading.Lock()
+
+    def _io(self, what):
+        time.sleep(self.fault.delay())
+        self.fault.maybe_fail(what)
+
+    def append_rows(self, rows):
+        self._io("append_rows")
+        with self._lock:
+            start = len(self.rows) + 1
+            self.rows.extend(list(r) for r in rows)
+            end = len(self.rows)
+        return {"updates": {"updatedRange": f"Sheet1!A{start}:J{end}"}}
+
+    def append_row(self, row):
+        return self.append_rows([row])
+
+    def col_values(self, col):
+        self._io("col_values")
+        with self._lock:
+            return [str(r[col - 1]) if len(r) >= col else "" for r in self.rows]
+
+    def get_all_values(self):
+        self._io("get_all_values")
+        with self._lock:
+            return [[str(v) for v in r] for r in self.rows]
+
+    def get_all_records(self):
+        self._io("get_all_records")
+        with self._lock:
+            return [dict(zip(self.rows[0], r)) for r in self.rows[1:]]
+
+    def delete_rows(self, start, end=None):
+        self._io("delete_rows")
+        with self._lock:
+            del self.rows[start - 1:(end or start)]
+
+    def batch_clear(self, ranges):
+        self._io("batch_clear")
+        with self._lock:
+            del self.rows[1:]
+
+class FakeAI:
+    """Pengganti call_gemini/call_groq: balas JSON transaksi yang membawa marker request."""
+    def __init__(self, fault, items_per_request, stream_chunk=24):
+        self.fault = fault
+        self.items_per_request = items_per_request
+        self.stream_chunk = stream_chunk
+
+    def _response(self, text):
+        marker = MARKER_RE.search(text)
+        marker = marker.group(0) if marker else "LT-?"
+        now = datetime.datetime.now()
+        items = [{
+            "tanggal": now.strftime("%Y-%m-%d"), "jam": now.strftime("%H:%M"),
+            "tipe": "Masuk" if "gaji" in text.lower() else "Keluar",
+            "kantong": random.choice(KANTONGS).lower(), "nama": f"{marker} #{i}",
+            "satuan": "x", "volume": 1, "harga_satuan": 15000,
+            "kategori": "Lainnya", "harga_total": 15000
+        } for i in range(self.items_per_request)]
+        return json.dumps({"transaksi": items})
+
+    def make(self, provider):
+        async def call(text, image_path=None, on_chunk=None):
+            # SDK asli memblok thread, jadi fake juga memakai default executor
+            await asyncio.to_thread(time.sleep, self.fault.delay())
+            self.fault.maybe_fail(provider)
+            response = self._response(text)
+            if on_chunk:
+                for i in range(0, len(response), self.stream_chunk):
+                    await on_chunk(response[i:i + self.stream_chunk])
+            return response
+        return call
+
+class FakeBot:
+    """Bot Telegram palsu: cukup untuk reply_text / edit_text / chat action / notifikasi."""
+    defaults = None
+
+    def __init__(self):
+        self._next_id = 1000
+        self.sent = 0
+        self.edits = 0
+        self.last_text = {}  # marker request -> teks terakhir yang dilihat user
+
+    async def send_message(self, chat_id, text, **kwargs):
+        from telegram import Message, Chat
+        self._next_id += 1
+        self.sent += 1
+        if current_marker.get():
+            self.last_text[current_marker.get()] = text
+        message = Message(self._next_id, datetime.datetime.now(datetime.timezone.utc),
+                          Chat(int(chat_id), Chat.PRIVATE), text=text)
+        message.set_bot(self)
+        return message
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.edits += 1
+        if current_marker.get():
+            self.last_text[current_marker.get()] = text
+        return True
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        return True
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        return True
+
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """Default executor yang mencatat thread aktif & antrian (untuk melihat saturasi)."""
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max_workers, thread_name_prefix="loadtest")
+        self.capacity = max_workers
+        self._stats_lock = threading.Lock()
+        self.active = self.queued = 0
+        self.peak_active = self.peak_queued = 0
+        self.submitted = 0
+        self.queue_waits = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        submitted_at = time.perf_counter()
+        with self._stats_lock:
+            self.submitted += 1
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        def tracked():
+            with self._stats_lock:
+                self.queued -= 1
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+                self.queue_waits.append(time.perf_counter() - submitted_at)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.active -= 1
+
+        return super().submit(tracked)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def fabricate_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}"},
+            "text": text,
+        },
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Burst load generator (webhook + Telegram) dengan fake Sheets/AI.")
+    parser.add_argument("--webhook", type=int, default=100, help="Jumlah request ke /webhook/macrodroid")
+    parser.add_argument("--telegram", type=int, default=30, help="Jumlah Update Telegram ke handle_message")
+    parser.add_argument("--concurrency", type=int, default=50, help="Request yang berjalan bersamaan")
+    parser.add_argument("--users", type=int, default=2, help="Jumlah user Telegram palsu")
+    parser.add_argument("--per-user-ledger", action="store_true", help="Tiap user punya spreadsheet sendiri (USER_SHEETS)")
+    parser.add_argument("--items", type=int, default=1, help="Item transaksi per respons AI")
+    parser.add_argument("--dup-rate", type=float, default=0.0, help="Peluang notif MacroDroid terkirim dua kali (id sama)")
+    parser.add_argument("--sheet-latency", type=float, default=0.2)
+    parser.add_argument("--sheet-error-rate", type=float, default=0.0)
+    parser.add_argument("--ai-latency", type=float, default=0.8)
+    parser.add_argument("--ai-error-rate", type=float, default=0.0, help="Error Gemini (fallback ke Groq)")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.1, help="Jitter latency (+/- detik)")
+    parser.add_argument("--executor-workers", type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                        help="Ukuran default executor (default sama dengan asyncio)")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+async def run(args):
+    import httpx
+    from telegram import Update
+
+    import main
+    from config.settings import ALLOWED_USERS, USER_SHEETS, SHEET_NAME, WEBHOOK_SECRET
+    from services import ai_service as ai_module
+    from services.sheets_service import sheets_service
+    from services.notification_service import notification_dispatcher
+    from handlers.messages import handle_message
+
+    rng = random.Random(args.seed)
+    executor = InstrumentedExecutor(args.executor_workers)
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    # --- Pasang fake ---
+    sheet_fault = FakeFault(args.sheet_latency, args.jitter, args.sheet_error_rate, rng)
+    sheets = {}
+
+    def open_fake_worksheet(name):
+        if name not in sheets:
+            sheets[name] = FakeWorksheet(name, sheet_fault)
+        return None, sheets[name]
+
+    sheets_service._open_worksheet = open_fake_worksheet
+
+    ai = ai_module.ai_service
+    ai.call_gemini = FakeAI(FakeFault(args.ai_latency, args.jitter, args.ai_error_rate, rng), args.items).make("Gemini")
+    ai.call_groq = FakeAI(FakeFault(args.ai_latency, args.jitter, args.groq_error_rate, rng), args.items).make("Groq")
+    ai_module.GOOGLE_API_KEY = ai_module.GROQ_API_KEY = "loadtest"
+
+    user_ids = [700000 + i for i in range(args.users)]
+    ALLOWED_USERS.extend(str(u) for u in user_ids)
+    if args.per_user_ledger:
+        USER_SHEETS.update({str(u): f"LoadTest-{u}" for u in user_ids})
+
+    bot = FakeBot()
+    notification_dispatcher.start(bot)
+    context = SimpleNamespace(bot=bot, args=[])
+
+    # --- Skenario ---
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = {"webhook": [], "telegram": []}
+    failures = {"webhook": 0, "telegram": 0}
+    expected = {}  # marker -> jumlah baris yang seharusnya ada
+
+    async def webhook_request(client, n):
+        marker = f"LT-{n}"
+        text = f"Top up ShopeePay Rp{rng.randint(10, 500)}.000 berhasil {marker}"
+        payload = {"text": text, "id": marker}
+        sends = 2 if rng.random() < args.dup_rate else 1
+        for _ in range(sends):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/webhook/macrodroid", json=payload,
+                                                 headers={"x-secret-token": WEBHOOK_SECRET})
+                    body = response.json()
+                    ok = response.status_code == 200 and not str(body.get("result", "")).startswith("❌")
+                except Exception:
+                    ok = False
+                latencies["webhook"].append(time.perf_counter() - start)
+                if ok and body.get("status") == "success":
+                    expected[marker] = args.items
+                elif not ok:
+                    failures["webhook"] += 1
+
+    async def telegram_request(n):
+        marker = f"LT-{n}"
+        user_id = user_ids[n % len(user_ids)]
+        update = Update.de_json(fabricate_update(n, user_id, f"Beli kopi {rng.randint(10, 50)}rb pakai gopay {marker}"), bot)
+        current_marker.set(marker)
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await handle_message(update, context)
+                # Handler menelan error sendiri, jadi nilai dari pesan terakhir ke user
+                ok = bot.last_text.get(marker, "").startswith("✅")
+            except Exception:
+                ok = False
+            latencies["telegram"].append(time.perf_counter() - start)
+        if ok:
+            expected[marker] = args.items
+        else:
+            failures["telegram"] += 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    wall_start = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        tasks = [webhook_request(client, i) for i in range(args.webhook)]
+        tasks += [telegram_request(args.webhook + i) for i in range(args.telegram)]
+        rng.shuffle(tasks)
+        await asyncio.gather(*tasks)
+    wall = time.perf_counter() - wall_start
+    await notification_dispatcher.stop()
+
+    # --- Cek baris di fake sheet ---
+    counts = {}
+    for wks in sheets.values():
+        for row in wks.rows[1:]:
+            match = MARKER_RE.search(str(row[4]))
+            if match:
+                counts[match.group(0)] = counts.get(match.group(0), 0) + 1
+
+    duplicated = {m: c for m, c in counts.items() if c > expected.get(m, 0)}
+    lost = {m: n for m, n in expected.items() if counts.get(m, 0) < n}
+
+    # --- Laporan ---
+    total = sum(len(v) for v in latencies.values())
+    print(f"Request: {total} dalam {wall:.2f} s -> {total / wall:.1f} req/s (concurrency {args.concurrency})")
+    print(f"{'Jalur':<10} {'n':>5} {'gagal':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9}")
+    for path, values in latencies.items():
+        print(f"{path:<10} {len(values):>5} {failures[path]:>6} {percentile(values, 50) * 1000:>9.0f} "
+              f"{percentile(values, 95) * 1000:>9.0f} {percentile(values, 99) * 1000:>9.0f}")
+    print()
+    print(f"Default executor: {executor.capacity} thread, peak aktif {executor.peak_active}, "
+          f"peak antrian {executor.peak_queued}, {executor.submitted} job")
+    print(f"  tunggu antrian p50 {percentile(executor.queue_waits, 50) * 1000:.0f} ms, "
+          f"p99 {percentile(executor.queue_waits, 99) * 1000:.0f} ms"
+          + ("  <-- SATURASI" if executor.peak_active >= executor.capacity else ""))
+    print()
+    print(f"Fake sheet: {sum(counts.values())} baris di {len(sheets)} ledger; "
+          f"{len(duplicated)} marker ganda, {len(lost)} marker hilang")
+    for marker, count in list(duplicated.items())[:10]:
+        print(f"  GANDA {marker}: {count} baris (harusnya {expected.get(marker, 0)})")
+    for marker, count in list(lost.items())[:10]:
+        print(f"  HILANG {marker}: {counts.get(marker, 0)}/{count} baris")
+    print(f"Telegram palsu: {bot.sent} pesan, {bot.edits} edit")
+    return 1 if duplicated or lost else 0
+
+def cli(argv=None):
+    args = parse_args(argv)
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    cli()
@@ -1,5 +1,10 @@
 import os
+import copy
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
 from dotenv import load_dotenv
 
 # Load Environment Variables
@@ -9,10 +14,45 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "mysecret123")
 
+# Mode update Telegram: "polling" (default, hanya 1 worker) atau "webhook" (bisa N worker uvicorn)
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # URL publik, cth: https://bot.domain.com
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", WEBHOOK_SECRET)
+
+# Notifikasi keluar (batas flood Telegram: ~1 pesan/detik per chat, ~30 pesan/detik global)
+NOTIFY_PER_CHAT_RATE = float(os.getenv("NOTIFY_PER_CHAT_RATE", "1.0"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_COALESCE_WINDOW = float(os.getenv("NOTIFY_COALESCE_WINDOW", "2.0"))  # Detik, notif berdekatan digabung
+
+# Server
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WEB_RELOAD = os.getenv("WEB_RELOAD", "false").lower() == "true"  # Auto-reload (development, mode polling)
+
+# State bersama antar worker (cache, dedupe, undo, leader)
+STATE_DB = os.getenv("STATE_DB", "state.db")
+LEADER_LEASE_TTL = int(os.getenv("LEADER_LEASE_TTL", "30"))
+
 # Google Sheets
 SHEET_NAME = os.getenv("SHEET_NAME")
 CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE")
 
+# Multi-tenant: pemetaan user -> spreadsheet, format "uid1:NamaSheet1,uid2:NamaSheet2"
+# User yang tidak terdaftar di sini tetap memakai SHEET_NAME.
+user_sheets_raw = os.getenv("USER_SHEETS", "")
+USER_SHEETS = {}
+for pair in user_sheets_raw.split(","):
+    uid, _, name = pair.partition(":")
+    if uid.strip() and name.strip():
+        USER_SHEETS[uid.strip()] = name.strip()
+
+# Cache DataFrame ledger (detik); tetap di-refresh otomatis setiap ada penulisan dari bot
+LEDGER_CACHE_TTL = int(os.getenv("LEDGER_CACHE_TTL", "60"))
+
+# Jumlah maksimal ledger (spreadsheet) yang dibuka bersamaan sebelum di-evict (LRU)
+MAX_OPEN_LEDGERS = int(os.getenv("MAX_OPEN_LEDGERS", "8"))
+
 # Security
 allowed_users_raw = os.getenv("ALLOWED_USERS", "")
 ALLOWED_USERS = [uid.strip() for uid in allowed_users_raw.split(",") if uid.strip()]
@@ -21,20 +61,89 @@ ALLOWED_USERS = [uid.strip() for uid in allowed_users_raw.split(",") if uid.stri
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Streaming: item transaksi ditampilkan satu per satu selagi AI masih menulis
+AI_STREAMING = os.getenv("AI_STREAMING", "false").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # Detik antar edit pesan Telegram
+
+# Logging
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" atau "json"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))  # Rotasi tiap 5 MB
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "3"))
+LOG_MAX_PAYLOAD = int(os.getenv("LOG_MAX_PAYLOAD", "1000"))  # Pesan lebih panjang dipotong
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler yang memotong pesan besar (payload INFO/DEBUG) sebelum masuk antrian.
+    WARNING ke atas dan record dengan exc_info tidak dipotong: baris terakhir traceback = error aslinya.
+    """
+    def __init__(self, log_queue, max_payload):
+        super().__init__(log_queue)
+        self.max_payload = max_payload
+
+    def prepare(self, record):
+        if record.levelno >= logging.WARNING or record.exc_info:
+            return super().prepare(record)
+        message = record.getMessage()
+        if len(message) > self.max_payload:
+            message = f"{message[:self.max_payload]}... [+{len(message) - self.max_payload} chars]"
+        record = copy.copy(record)
+        record.msg, record.args = message, None
+        return super().prepare(record)
+
+class JsonFormatter(logging.Formatter):
+    """Format log satu baris JSON (untuk journald / log shipper)."""
+    def format(self, record):
+        return json.dumps({
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }, ensure_ascii=False)
+
 # Logging Configuration
 def setup_logging():
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    
+    """
+    Semua log masuk ke antrian (tidak blocking), lalu ditulis oleh thread
+    QueueListener ke file (dengan rotasi) dan terminal.
+    Multi-worker (webhook, WEB_WORKERS > 1) dan WEB_RELOAD (proses reloader + anak):
+    hanya ke terminal/journald, karena rotasi satu file dari banyak proses tidak aman.
+    """
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    handlers = [logging.StreamHandler()]  # Tampilkan di terminal
+    if not (TELEGRAM_MODE == "webhook" and WEB_WORKERS > 1) and not WEB_RELOAD:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        ))  # Simpan ke file
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = TruncatingQueueHandler(log_queue, LOG_MAX_PAYLOAD)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Format akhir dilakukan listener
+
     # Configure Root Logger
     logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        handlers=[
-            logging.FileHandler("bot.log"), # Simpan ke file
-            logging.StreamHandler()         # Tampilkan di terminal
-        ]
+        level=LOG_LEVEL,
+        handlers=[queue_handler],
+        force=True
     )
     
+    # Log uvicorn (error & access) juga lewat antrian, bukan handler sinkron bawaannya
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
     # Suppress noisy libraries
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("pyngrok").setLevel(logging.WARNING)
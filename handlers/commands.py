@@ -1,4 +1,3 @@
-import pandas as pd
 import asyncio
 import logging
 from datetime import datetime
@@ -7,7 +6,8 @@ from telegram.ext import ContextTypes
 
 from config.settings import ALLOWED_USERS
 from services.sheets_service import sheets_service
-from utils.helpers import clean_for_json
+from services.state_store import state_store
+from utils.schema import hitung_saldo
 
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Menampilkan menu utama dengan tombol."""
@@ -47,30 +47,60 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def undo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if str(update.effective_user.id) not in ALLOWED_USERS: return
     
+    user_id = update.effective_user.id
     msg = await update.message.reply_text("⏳ Undo transaksi terakhir...")
-    wks = sheets_service.get_sheet()
+    wks = await sheets_service.get_sheet(user_id)
     if not wks:
         await msg.edit_text("❌ Database error.")
         return
 
     try:
-        # Ambil semua data untuk mendapatkan index baris terakhir yang terisi
-        # get_all_values lebih aman daripada row_count (yang mengembalikan total grid, termasuk baris kosong)
-        all_values = await asyncio.to_thread(wks.get_all_values)
-        num_rows = len(all_values)
-        
-        # Asumsi baris 1 adalah header, jadi jangan hapus jika rows <= 1
-        if num_rows <= 1:
-            await msg.edit_text("⚠️ Data kosong (hanya header).")
-            return
-
-        last_row_data = all_values[-1] # Data baris terakhir
-        last_item = "Item"
-        if len(last_row_data) > 4:
-            last_item = last_row_data[4]
-
-        # Hapus baris terakhir yang memiliki data
-        await asyncio.to_thread(wks.delete_rows, num_rows)
+        ledger_name = sheets_service.ledger_name_for(user_id)
+        async with sheets_service.lock_for(user_id):
+            # Ambil semua data untuk mendapatkan index baris terakhir yang terisi
+            # get_all_values lebih aman daripada row_count (yang mengembalikan total grid, termasuk baris kosong)
+            all_values = await asyncio.to_thread(wks.get_all_values)
+            num_rows = len(all_values)
+
+            # Prioritas: transaksi terakhir milik user ini / notif tanpa pemilik (undo stack bersama)
+            entry = await state_store.peek_undo(user_id, ledger_name)
+            entry_id = entry["id"] if entry else None
+            if entry and entry["start_row"] == 0:
+                # Baris milik entry ini sudah terhapus oleh undo/aksi lain
+                await state_store.discard_undo(entry_id)
+                await msg.edit_text(
+                    f"⚠️ Transaksi _{entry['label']}_ sudah tidak ada di Sheets. Tidak ada yang dihapus.",
+                    parse_mode="Markdown"
+                )
+                return
+            if entry:
+                start_row, end_row = entry["start_row"], entry["end_row"]
+                current_names = [row[4] if len(row) > 4 else "" for row in all_values[start_row - 1:end_row]]
+                # Nomor baris bisa basi (worker lain, edit manual) -> cocokkan isi dulu
+                if current_names != entry["names"]:
+                    await state_store.discard_undo(entry_id)
+                    await msg.edit_text(
+                        f"⚠️ Baris _{entry['label']}_ sudah berubah di Sheets. Undo dibatalkan, "
+                        "silakan hapus manual.", parse_mode="Markdown"
+                    )
+                    return
+                last_item = entry["label"] or "Item"
+            else:
+                # Asumsi baris 1 adalah header, jadi jangan hapus jika rows <= 1
+                if num_rows <= 1:
+                    await msg.edit_text("⚠️ Data kosong (hanya header).")
+                    return
+
+                # Hapus baris terakhir yang memiliki data
+                start_row = end_row = num_rows
+                last_row_data = all_values[-1] # Data baris terakhir
+                last_item = "Item"
+                if len(last_row_data) > 4:
+                    last_item = last_row_data[4]
+
+            await asyncio.to_thread(wks.delete_rows, start_row, end_row)
+            await state_store.rows_deleted(ledger_name, start_row, end_row, entry_id)
+            await sheets_service.mark_dirty(user_id)
         await msg.edit_text(f"✅ **Undo:** _{last_item}_ dihapus.", parse_mode="Markdown")
     except Exception as e:
         import traceback
@@ -83,12 +113,16 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ **BAHAYA!** Ketik `/reset confirm` untuk menghapus SEMUA data.", parse_mode="Markdown")
         return
 
+    user_id = update.effective_user.id
     msg = await update.message.reply_text("⏳ Mereset database...")
-    wks = sheets_service.get_sheet()
+    wks = await sheets_service.get_sheet(user_id)
     if not wks: return
 
     try:
-        await asyncio.to_thread(wks.batch_clear, ["A2:J"])
+        async with sheets_service.lock_for(user_id):
+            await asyncio.to_thread(wks.batch_clear, ["A2:J"])
+            await state_store.clear_undo(sheets_service.ledger_name_for(user_id))
+            await sheets_service.mark_dirty(user_id)
         await msg.edit_text("♻️ **Database Bersih!** (Header aman).")
     except Exception as e:
         await msg.edit_text(f"❌ Gagal: {e}")
@@ -107,34 +141,29 @@ async def setsaldo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Jumlah uang harus angka.")
         return
 
+    user_id = update.effective_user.id
     msg = await update.message.reply_text("🧮 Menghitung selisih...")
-    wks = sheets_service.get_sheet()
+    wks = await sheets_service.get_sheet(user_id)
     if not wks: return
 
     try:
-        data = await asyncio.to_thread(wks.get_all_records)
-        df = pd.DataFrame(data)
-        df.columns = [str(c).lower().strip() for c in df.columns]
-        
-        col_harga = next((c for c in df.columns if 'total' in c or 'amount' in c or 'harga' in c if 'satuan' not in c), None)
-        
-        if not col_harga or df.empty:
-            current_saldo = 0
-        else:
-            mask = df['kantong'].astype(str).str.lower() == target_kantong.lower()
-            df_k = df.loc[mask].copy()
-            df_k[col_harga] = pd.to_numeric(df_k[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True), errors='coerce').fillna(0)
-            
-            masuk = df_k[df_k['tipe'].str.lower() == 'masuk'][col_harga].sum()
-            keluar = df_k[df_k['tipe'].str.lower() == 'keluar'][col_harga].sum()
-            current_saldo = int(masuk - keluar)
+        # Data segar: koreksi saldo permanen tidak boleh dihitung dari cache (edit manual)
+        ledger = await sheets_service.load_ledger_df(user_id, fresh=True)
+        if not ledger:
+            await msg.edit_text("❌ Database error.")
+            return
+
+        df, col_harga = ledger
+        saldo_per_kantong = hitung_saldo(df, col_harga)
+        mask = saldo_per_kantong.index.astype(str).str.lower() == target_kantong.lower()
+        current_saldo = int(saldo_per_kantong[mask].sum())
 
         selisih = target_saldo - current_saldo
         if selisih == 0:
             await msg.edit_text(f"✅ Saldo {target_kantong} sudah pas Rp {target_saldo:,}. Tidak ada perubahan.")
             return
 
-        corrected_kantong = await sheets_service.get_correct_kantong_case(target_kantong)
+        corrected_kantong = await sheets_service.get_correct_kantong_case(target_kantong, user_id)
         tipe_transaksi = "Masuk" if selisih > 0 else "Keluar"
         nominal_koreksi = int(abs(selisih))
         
@@ -144,8 +173,9 @@ async def setsaldo_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             corrected_kantong, "Koreksi Saldo Otomatis", "x", 1, 0, "Lainnya", nominal_koreksi
         ]
         
-        row_clean = clean_for_json(row)
-        await asyncio.to_thread(wks.append_row, row_clean)
+        async with sheets_service.lock_for(user_id):
+            response = await asyncio.to_thread(wks.append_row, row)
+            await sheets_service.record_append(user_id, response, names=["Koreksi Saldo Otomatis"])
         await msg.edit_text(
             f"✅ **Saldo Disesuaikan!**\n"
             f"Saldo Lama: Rp {current_saldo:,}\n"
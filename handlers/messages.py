@@ -1,14 +1,15 @@
 import os
-import pandas as pd
+import time
 import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config.settings import ALLOWED_USERS
+from config.settings import ALLOWED_USERS, STREAM_EDIT_INTERVAL
 from services.sheets_service import sheets_service
 from services.ai_service import ai_service
 from services.transaction_service import core_process_transaction
+from utils.schema import CATEGORICAL_COLUMNS, parse_amount, hitung_saldo
 from handlers.commands import undo_command, help_command, start_command
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -44,24 +45,24 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         msg = await update.message.reply_text("🧠 Sedang menganalisis data (PandasAI)...")
         
         try:
-            wks = sheets_service.get_sheet()
-            data = await asyncio.to_thread(wks.get_all_records)
-            
-            if not data:
+            ledger = await sheets_service.load_ledger_df(update.effective_user.id)
+            if not ledger:
+                await msg.edit_text("❌ Database error.")
+                return
+
+            df, col_harga = ledger
+            if df.empty:
                 await msg.edit_text("❌ Data kosong.")
                 return
 
-            df = pd.DataFrame(data)
-            df.columns = [str(c).lower().strip() for c in df.columns]
-            
-            if 'tanggal' in df.columns:
-                df['tanggal'] = pd.to_datetime(df['tanggal'], errors='coerce')
-            
-            candidates = [c for c in df.columns if ('total' in c or 'amount' in c or 'harga' in c) and 'satuan' not in c]
-            col_harga = candidates[0] if candidates else df.columns[-1]
-            
-            df[col_harga] = df[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True)
-            df[col_harga] = pd.to_numeric(df[col_harga], errors='coerce').fillna(0)
+            # Salinan: PandasAI boleh mengubah df tanpa merusak cache ledger.
+            # Kolom kategori dikembalikan ke object agar kode hasil AI bisa mengisi nilai baru.
+            df = df.copy()
+            for col in CATEGORICAL_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].astype(object)
+            if not col_harga:
+                df[df.columns[-1]] = parse_amount(df[df.columns[-1]])
 
             hasil = await ai_service.run_analysis(user_input, df)
             
@@ -98,38 +99,26 @@ async def proses_cek_saldo(update, context):
     msg = await update.message.reply_text("🔍 Menghitung aset...")
     
     try:
-        wks = sheets_service.get_sheet()
-        if not wks:
+        ledger = await sheets_service.load_ledger_df(update.effective_user.id)
+        if not ledger:
             await msg.edit_text("❌ Database error.")
             return
             
-        data = await asyncio.to_thread(wks.get_all_records)
-        if not data:
+        df, col_harga = ledger
+        if df.empty:
             await msg.edit_text("Belum ada data.")
             return
 
-        df = pd.DataFrame(data)
-        df.columns = [c.lower().strip() for c in df.columns]
-        
-        col_harga = next((c for c in df.columns if 'total' in c or 'amount' in c or 'harga' in c if 'satuan' not in c), None)
-        
         if not col_harga:
             await msg.edit_text("❌ Kolom harga tidak ditemukan.")
             return
 
+        saldo_per_kantong = hitung_saldo(df, col_harga)
         total_aset = 0
-        kantongs = df['kantong'].unique()
         report = "💰 **Kondisi Keuangan**\n"
         
-        for k in kantongs:
+        for k, saldo in saldo_per_kantong.items():
             if not k: continue
-            df_k = df[df['kantong'] == k].copy()
-            df_k[col_harga] = pd.to_numeric(df_k[col_harga].astype(str).str.replace(r'[^\d-]', '', regex=True), errors='coerce').fillna(0)
-            
-            masuk = df_k[df_k['tipe'].str.lower() == 'masuk'][col_harga].sum()
-            keluar = df_k[df_k['tipe'].str.lower() == 'keluar'][col_harga].sum()
-            saldo = masuk - keluar
-            
             total_aset += saldo
             report += f"\n🏦 **{k}:** Rp {saldo:,.0f}"
 
@@ -147,7 +136,7 @@ async def proses_catat_transaksi(update: Update, context: ContextTypes.DEFAULT_T
 
         if update.message.voice:
             voice_file = await update.message.voice.get_file()
-            media_path = "temp_audio.ogg"
+            media_path = f"temp_audio_{update.effective_user.id}.ogg"
             await voice_file.download_to_drive(media_path)
             
             with open(media_path, "rb") as file:
@@ -165,10 +154,33 @@ async def proses_catat_transaksi(update: Update, context: ContextTypes.DEFAULT_T
 
         elif update.message.photo:
             photo_file = await update.message.photo[-1].get_file()
-            media_path = "temp_image.jpg"
+            media_path = f"temp_image_{update.effective_user.id}.jpg"
             await photo_file.download_to_drive(media_path)
 
-        report_text = await core_process_transaction(user_text_input, media_path, source_info="Telegram")
+        # Tampilkan item satu per satu selagi AI masih streaming (dibatasi rate edit Telegram)
+        streamed_lines = []
+        last_edit = 0.0
+
+        async def on_item(line):
+            nonlocal last_edit
+            if line is None:
+                # Provider AI berganti: item dari stream sebelumnya dibuang
+                streamed_lines.clear()
+                return
+            streamed_lines.append(line)
+            now = time.monotonic()
+            if now - last_edit < STREAM_EDIT_INTERVAL:
+                return
+            last_edit = now
+            try:
+                await msg.edit_text("⚡ Memproses...\n\n" + "\n".join(streamed_lines))
+            except Exception as e:
+                logging.debug(f"Edit progres dilewati: {e}")
+
+        report_text = await core_process_transaction(
+            user_text_input, media_path, source_info="Telegram",
+            user_id=update.effective_user.id, on_item=on_item
+        )
         
         if media_path:
             try: os.remove(media_path)
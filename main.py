@@ -1,3 +1,6 @@
+import os
+import socket
+import asyncio
 import uvicorn
 import logging
 from contextlib import asynccontextmanager
@@ -5,16 +8,57 @@ from fastapi import FastAPI, Request, HTTPException, Header
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
 
-from config.settings import TELEGRAM_TOKEN, WEBHOOK_SECRET, ALLOWED_USERS, setup_logging
+from config.settings import (
+    TELEGRAM_TOKEN, WEBHOOK_SECRET, ALLOWED_USERS, setup_logging,
+    TELEGRAM_MODE, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_SECRET,
+    WEB_HOST, WEB_PORT, WEB_WORKERS, WEB_RELOAD, LEADER_LEASE_TTL
+)
 from handlers.commands import start_command, help_command, undo_command, reset_command, setsaldo_command
 from handlers.messages import handle_message
 from services.transaction_service import core_process_transaction
+from services.state_store import state_store
+from services.notification_service import notification_dispatcher
 
 # Initialize Logging
 setup_logging()
 
 # Setup Telegram Application
-ptb_application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+# Mode webhook: update masuk lewat route FastAPI, jadi tidak perlu Updater (polling)
+if TELEGRAM_MODE == "webhook" and not TELEGRAM_WEBHOOK_URL:
+    raise RuntimeError("TELEGRAM_MODE=webhook membutuhkan TELEGRAM_WEBHOOK_URL (URL publik bot).")
+if TELEGRAM_MODE == "webhook":
+    ptb_application = ApplicationBuilder().token(TELEGRAM_TOKEN).updater(None).build()
+else:
+    ptb_application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+_background_tasks = set()
+
+async def run_leader_jobs():
+    """Job yang cukup dijalankan satu worker saja (leader)."""
+    if TELEGRAM_MODE == "webhook":
+        await ptb_application.bot.set_webhook(
+            url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/webhook/telegram",
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logging.info("🔗 Telegram webhook terdaftar.")
+
+async def leader_loop():
+    """Perpanjang lease leader secara berkala; ambil alih jika leader lama mati."""
+    is_leader = False
+    while True:
+        try:
+            now_leader = await state_store.acquire_lease("leader", WORKER_ID, LEADER_LEASE_TTL)
+            if now_leader and not is_leader:
+                logging.info(f"👑 Worker {WORKER_ID} menjadi leader.")
+                await run_leader_jobs()
+            is_leader = now_leader
+            # Mode multi-worker: hanya leader yang mengirim notifikasi dari outbox
+            notification_dispatcher.is_leader = now_leader
+        except Exception as e:
+            logging.error(f"Leader loop error: {e}")
+        await asyncio.sleep(LEADER_LEASE_TTL / 3)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -33,15 +77,25 @@ async def lifespan(app: FastAPI):
     # 2. Start Bot
     await ptb_application.initialize()
     await ptb_application.start()
-    await ptb_application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    notification_dispatcher.start(ptb_application.bot)
+    if TELEGRAM_MODE != "webhook":
+        await ptb_application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    leader_task = asyncio.create_task(leader_loop())
     
-    logging.info("🚀 Bot Hybrid (Telegram + Webhook) STARTED!")
+    logging.info(f"🚀 Bot Hybrid (Telegram {TELEGRAM_MODE} + Webhook) STARTED! worker={WORKER_ID}")
     
     yield
     
     # 3. Stop Bot
     logging.info("🛑 Stopping Bot...")
-    await ptb_application.updater.stop()
+    leader_task.cancel()
+    notification_dispatcher.is_leader = False
+    await state_store.release_lease("leader", WORKER_ID)
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await notification_dispatcher.stop()
+    if ptb_application.updater:
+        await ptb_application.updater.stop()
     await ptb_application.stop()
     await ptb_application.shutdown()
 
@@ -56,31 +110,67 @@ async def macrodroid_webhook(request: Request, x_secret_token: str = Header(None
     try:
         data = await request.json()
         text_input = data.get("text", "")
+        # Opsional: user pemilik notifikasi -> dicatat ke ledger user tsb (USER_SHEETS)
+        owner_id = str(data.get("user_id", "")).strip() or None
+        # Opsional: id unik notifikasi agar kiriman ganda dari MacroDroid tidak tercatat 2x
+        notif_id = str(data.get("id", "")).strip()
     except:
         raise HTTPException(status_code=400, detail="Invalid JSON")
         
     if not text_input:
         return {"status": "ignored", "message": "Empty text"}
+
+    if owner_id and owner_id not in ALLOWED_USERS:
+        raise HTTPException(status_code=403, detail="Unknown user_id")
+
+    if notif_id and not await state_store.claim(f"macrodroid:{notif_id}", ttl=24 * 3600):
+        return {"status": "ignored", "message": "Duplicate notification"}
         
-    result_text = await core_process_transaction(text_input, source_info="MacroDroid")
+    result_text = await core_process_transaction(text_input, source_info="MacroDroid", user_id=owner_id)
     
     # Hanya kirim notifikasi jika ada hasil (tidak kosong)
-    if result_text and ALLOWED_USERS:
-        for user_id in ALLOWED_USERS:
-            try:
-                await ptb_application.bot.send_message(
-                    chat_id=user_id, 
-                    text=f"📩 **Notif Masuk:**\n{result_text}", 
-                    parse_mode="Markdown"
-                )
-            except Exception as e:
-                logging.error(f"Gagal kirim notif telegram ke {user_id}: {e}")
+    recipients = [owner_id] if owner_id else ALLOWED_USERS
+    if result_text and recipients:
+        # Dikirim di background oleh dispatcher (rate limit + digabung per chat)
+        for user_id in recipients:
+            await notification_dispatcher.submit(user_id, f"📩 **Notif Masuk:**\n{result_text}")
             
     return {"status": "success", "result": result_text}
 
+@app.post("/webhook/telegram")
+async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: str = Header(None)):
+    """Endpoint update Telegram (mode webhook). Bisa dilayani worker mana pun."""
+    if TELEGRAM_MODE != "webhook":
+        raise HTTPException(status_code=404, detail="Webhook mode disabled")
+    if x_telegram_bot_api_secret_token != TELEGRAM_WEBHOOK_SECRET:
+        raise HTTPException(status_code=401, detail="Invalid Secret Token")
+
+    try:
+        data = await request.json()
+        update = Update.de_json(data, ptb_application.bot)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid Update")
+
+    # Telegram mengirim ulang update jika respons lambat -> proses sekali saja
+    if not await state_store.claim(f"tg_update:{update.update_id}", ttl=24 * 3600):
+        return {"status": "duplicate"}
+
+    # Balas Telegram secepatnya, proses di background
+    task = asyncio.create_task(ptb_application.process_update(update))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {"status": "ok"}
+
 @app.get("/")
 async def root():
     return {"status": "running", "bot": "Gemini Finance Bot"}
 
 if __name__ == '__main__':
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if TELEGRAM_MODE == "webhook":
+        uvicorn.run("main:app", host=WEB_HOST, port=WEB_PORT, workers=WEB_WORKERS, log_config=None)
+    else:
+        # Polling: hanya boleh 1 worker (2 worker = 2 poller untuk token yang sama)
+        if WEB_WORKERS > 1:
+            logging.warning("WEB_WORKERS > 1 diabaikan pada mode polling. Gunakan TELEGRAM_MODE=webhook.")
+        # Reload hanya untuk development (WEB_RELOAD=true); service systemd menjalankan tanpa reload
+        uvicorn.run("main:app", host=WEB_HOST, port=WEB_PORT, reload=WEB_RELOAD, log_config=None)
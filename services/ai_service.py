@@ -2,6 +2,7 @@ import os
 import json
 import asyncio
 import logging
+import threading
 import PIL.Image
 from groq import Groq
 import google.generativeai as genai
@@ -12,6 +13,9 @@ from config.settings import GOOGLE_API_KEY, GROQ_API_KEY
 from utils.helpers import encode_image
 from utils.prompts import get_system_prompt
 
+class StreamCallbackError(Exception):
+    """Error dari callback `on_chunk` (proses kita sendiri), bukan dari provider AI."""
+
 class MyGroqLLM(LLM):
     """Custom LLM adapter for PandasAI using Groq (Llama 3)."""
     def __init__(self, groq_client):
@@ -73,42 +77,107 @@ class AIService:
         else:
             self.groq_client = None
 
-    # ... (fungsi call_gemini, call_groq, smart_ai_processing tetap sama) ...
-    async def call_gemini(self, text, image_path=None):
+    async def _consume_stream(self, start_stream, extract_text, on_chunk):
+        """
+        Jalankan iterator stream (blocking) di thread, teruskan tiap potongan teks
+        ke `on_chunk` di event loop, lalu kembalikan teks lengkap.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        end = object()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                for part in start_stream():
+                    if stop.is_set():
+                        break
+                    text = extract_text(part)
+                    if text:
+                        loop.call_soon_threadsafe(chunks.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, end)
+
+        producer = loop.run_in_executor(None, worker)
+        collected = []
+        try:
+            while True:
+                part = await chunks.get()
+                if part is end:
+                    break
+                if isinstance(part, Exception):
+                    raise part
+                collected.append(part)
+                try:
+                    await on_chunk(part)
+                except Exception as e:
+                    raise StreamCallbackError(str(e)) from e
+        finally:
+            # Hentikan thread stream (berhenti di potongan berikutnya) apa pun hasilnya
+            stop.set()
+            await producer
+        return "".join(collected)
+
+    async def call_gemini(self, text, image_path=None, on_chunk=None):
         if not self.gemini_model: raise Exception("Google API Key tidak dikonfigurasi.")
-        print("🔵 Mencoba Gemini...")
+        logging.info("🔵 Mencoba Gemini...")
         inputs = [get_system_prompt(), text]
         if image_path:
             img = PIL.Image.open(image_path)
             inputs.append(img)
+        if on_chunk:
+            return await self._consume_stream(
+                lambda: self.gemini_model.generate_content(inputs, stream=True),
+                lambda chunk: chunk.text,
+                on_chunk
+            )
         response = await asyncio.to_thread(self.gemini_model.generate_content, inputs)
         return response.text
 
-    async def call_groq(self, text, image_path=None):
+    async def call_groq(self, text, image_path=None, on_chunk=None):
         if not self.groq_client: raise Exception("Groq API Key tidak dikonfigurasi.")
-        print("🟠 Beralih ke Groq...")
+        logging.info("🟠 Beralih ke Groq...")
         messages = [{"role": "user", "content": [{"type": "text", "text": get_system_prompt() + "\nINPUT USER:\n" + text}]}]
         model_name = "llama-3.3-70b-versatile"
         if image_path:
             model_name = "llama-3.2-90b-vision-preview"
             base64_img = await asyncio.to_thread(encode_image, image_path)
             messages[0]["content"].append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_img}"}})
+        if on_chunk:
+            # JSON mode Groq tidak mendukung streaming, cukup andalkan instruksi di prompt
+            return await self._consume_stream(
+                lambda: self.groq_client.chat.completions.create(model=model_name, messages=messages, temperature=0, stream=True),
+                lambda chunk: chunk.choices[0].delta.content if chunk.choices else None,
+                on_chunk
+            )
         completion = await asyncio.to_thread(self.groq_client.chat.completions.create, model=model_name, messages=messages, temperature=0, response_format={"type": "json_object"})
         return completion.choices[0].message.content
         
-    async def smart_ai_processing(self, text, image_path=None):
+    async def smart_ai_processing(self, text, image_path=None, on_chunk=None):
+        """
+        Gemini dulu, fallback ke Groq. Jika `on_chunk` diisi, respons di-stream
+        dan `on_chunk(None)` dipanggil saat berpindah provider (stream diulang).
+        """
         json_result = ""; used_ai = ""
         if GOOGLE_API_KEY:
             try:
-                json_result = await self.call_gemini(text, image_path)
+                json_result = await self.call_gemini(text, image_path, on_chunk)
                 used_ai = "Gemini"
+            except StreamCallbackError:
+                raise  # Bukan kesalahan Gemini, jangan ulang di Groq
             except Exception as e:
                 logging.error(f"⚠️ Gemini Error/Limit: {e}. Switching to Groq.")
                 json_result = None
         if not json_result and GROQ_API_KEY:
+            if on_chunk:
+                await on_chunk(None)
             try:
-                json_result = await self.call_groq(text, image_path)
+                json_result = await self.call_groq(text, image_path, on_chunk)
                 used_ai = "Groq Llama"
+            except StreamCallbackError:
+                raise
             except Exception as e:
                 raise Exception(f"Semua AI Gagal. Error Groq: {e}")
         return json_result, used_ai
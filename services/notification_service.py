@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from datetime import timedelta
+from telegram.error import BadRequest, RetryAfter
+from config.settings import (
+    NOTIFY_PER_CHAT_RATE, NOTIFY_GLOBAL_RATE, NOTIFY_COALESCE_WINDOW, TELEGRAM_MODE, WEB_WORKERS
+)
+from services.state_store import state_store
+
+TELEGRAM_MAX_LENGTH = 4096
+
+class TokenBucket:
+    """Rate limiter sederhana: `rate` token per detik, maksimal `capacity` token."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class NotificationDispatcher:
+    """
+    Pengirim pesan Telegram keluar: tiap chat punya antrian & worker sendiri
+    (chat berbeda terkirim paralel), dibatasi token bucket per chat dan global.
+    Pesan ke chat yang sama dalam jendela `coalesce_window` digabung jadi satu.
+
+    Mode `shared` (webhook multi-worker): bucket & antrian hanya berlaku per proses, jadi
+    `submit` menulis ke outbox di state store dan hanya worker leader yang mengirim.
+    Batas rate & penggabungan pun berlaku untuk seluruh bot, bukan per worker.
+    """
+    def __init__(self, per_chat_rate=NOTIFY_PER_CHAT_RATE, global_rate=NOTIFY_GLOBAL_RATE,
+                 coalesce_window=NOTIFY_COALESCE_WINDOW, max_retries=3,
+                 shared=TELEGRAM_MODE == "webhook" and WEB_WORKERS > 1, outbox_interval=0.5):
+        self.per_chat_rate = per_chat_rate
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.shared = shared
+        self.outbox_interval = outbox_interval
+        self.is_leader = False  # Diset oleh leader loop (main.py)
+        self._pump = None
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.bot = None
+        self._queues = {}
+        self._workers = {}
+
+    def start(self, bot):
+        self.bot = bot
+        if self.shared:
+            self._pump = asyncio.create_task(self._pump_outbox())
+
+    async def submit(self, chat_id, text, parse_mode="Markdown"):
+        """Kirim notifikasi dari worker mana pun (shared: lewat outbox, selain itu langsung antri)."""
+        if self.shared:
+            await state_store.push_outbox(chat_id, text, parse_mode)
+        else:
+            self.enqueue(chat_id, text, parse_mode)
+
+    def enqueue(self, chat_id, text, parse_mode="Markdown"):
+        """Masukkan pesan ke antrian chat (tidak menunggu pengiriman)."""
+        chat_id = str(chat_id)
+        if chat_id not in self._queues:
+            self._queues[chat_id] = asyncio.Queue()
+            self._workers[chat_id] = asyncio.create_task(self._chat_worker(chat_id))
+        self._queues[chat_id].put_nowait((text, parse_mode))
+
+    async def stop(self, timeout=10):
+        """Kirim sisa antrian (maksimal `timeout` detik), lalu hentikan worker."""
+        if self._pump:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues.values())), timeout
+            )
+        except asyncio.TimeoutError:
+            logging.warning("Sebagian notifikasi belum terkirim saat shutdown.")
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._queues.clear()
+        self._workers.clear()
+
+    async def _pump_outbox(self):
+        """Leader: pindahkan pesan dari outbox bersama ke antrian chat lokal."""
+        while True:
+            try:
+                if self.is_leader:
+                    for chat_id, text, parse_mode in await state_store.pop_outbox():
+                        self.enqueue(chat_id, text, parse_mode)
+            except Exception as e:
+                logging.error(f"Gagal baca outbox notifikasi: {e}")
+            await asyncio.sleep(self.outbox_interval)
+
+    async def _chat_worker(self, chat_id):
+        queue = self._queues[chat_id]
+        bucket = TokenBucket(self.per_chat_rate, 1)
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await queue.get()]
+
+            # Kumpulkan pesan lain yang datang dalam jendela coalesce
+            deadline = loop.time() + self.coalesce_window
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                for text, parse_mode in self._merge(batch):
+                    await self._send(chat_id, text, parse_mode, bucket)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _merge(self, batch):
+        """Gabungkan pesan berurutan dengan parse_mode sama, tanpa melewati batas panjang Telegram."""
+        merged = []
+        for text, parse_mode in batch:
+            if merged and merged[-1][1] == parse_mode and len(merged[-1][0]) + len(text) + 2 <= TELEGRAM_MAX_LENGTH:
+                merged[-1] = (f"{merged[-1][0]}\n\n{text}", parse_mode)
+            else:
+                merged.append((text, parse_mode))
+        return merged
+
+    async def _send(self, chat_id, text, parse_mode, bucket):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    break
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                logging.warning(f"Flood limit chat {chat_id}, retry {attempt + 1}/{self.max_retries} dalam {delay} detik.")
+                await asyncio.sleep(delay)
+            except BadRequest as e:
+                if not parse_mode:
+                    logging.error(f"Gagal kirim notif telegram ke {chat_id}: {e}")
+                    return
+                # Gabungan pesan bisa merusak entity Markdown -> kirim ulang sebagai teks biasa
+                logging.warning(f"Markdown notif ke {chat_id} ditolak ({e}), kirim ulang tanpa format.")
+                parse_mode = None
+            except Exception as e:
+                logging.error(f"Gagal kirim notif telegram ke {chat_id}: {e}")
+                return
+        logging.error(f"Gagal kirim notif telegram ke {chat_id}: retry habis.")
+
+# Instance global
+notification_dispatcher = NotificationDispatcher()
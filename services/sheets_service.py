@@ -1,61 +1,180 @@
 import gspread
 import logging
 import asyncio
+import re
 import time
-from config.settings import CREDENTIALS_FILE, SHEET_NAME
+import threading
+from collections import OrderedDict
+from config.settings import CREDENTIALS_FILE, SHEET_NAME, USER_SHEETS, MAX_OPEN_LEDGERS, LEDGER_CACHE_TTL
+from services.state_store import state_store
+from utils.schema import load_ledger
 
-class SheetsService:
-    def __init__(self):
-        self.client = None
+def parse_updated_rows(response):
+    """Ambil (baris_awal, baris_akhir) dari respons append Sheets API, cth 'Sheet1!A5:J7' -> (5, 7)."""
+    try:
+        updated_range = response["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    match = re.search(r"![A-Z]+(\d+)(?::[A-Z]+(\d+))?$", updated_range)
+    if not match:
+        return None
+    start_row = int(match.group(1))
+    return start_row, int(match.group(2) or start_row)
+
+class Ledger:
+    """Satu spreadsheet yang sedang terbuka: handle spreadsheet, worksheet & lock sendiri."""
+    def __init__(self, name):
+        self.name = name
+        self.spreadsheet = None
         self.sheet = None
-        self._kantong_cache = None
-        self._cache_time = 0
+        # DataFrame ter-normalisasi + versi data saat di-download
+        self.frame = None
+        self.frame_version = None
+        self.frame_time = 0
+        # Lock per ledger: tulis (append/undo/reset) satu user tidak menunggu ledger user lain
+        self.lock = asyncio.Lock()
+
+class SheetsService:
+    def __init__(self, max_open=MAX_OPEN_LEDGERS):
+        self._ledgers = OrderedDict()  # nama sheet -> Ledger, urutan = LRU
+        # Satu client gspread ter-otorisasi dipakai bersama semua ledger
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.max_open = max(1, max_open)
         self.CACHE_TTL = 600  # Cache berlaku selama 10 menit (600 detik)
 
-    def get_sheet(self):
-        """Koneksi ke Google Sheets (Singleton-like)."""
-        if self.sheet:
-            return self.sheet
-        
-        try:
-            gc = gspread.service_account(filename=CREDENTIALS_FILE)
-            sh = gc.open(SHEET_NAME)
-            self.sheet = sh.sheet1
-            return self.sheet
-        except Exception as e:
-            logging.error(f"Gagal koneksi Sheets: {e}")
-            return None
+    def ledger_name_for(self, user_id=None):
+        """Nama spreadsheet milik user (fallback ke SHEET_NAME)."""
+        if user_id is None:
+            return SHEET_NAME
+        return USER_SHEETS.get(str(user_id), SHEET_NAME)
+
+    def _get_ledger(self, user_id=None):
+        """Ambil/buat entry Ledger dan tandai sebagai yang terakhir dipakai."""
+        name = self.ledger_name_for(user_id)
+        ledger = self._ledgers.get(name)
+        if ledger:
+            self._ledgers.move_to_end(name)
+            return ledger
+
+        ledger = Ledger(name)
+        self._ledgers[name] = ledger
+        self._evict()
+        return ledger
+
+    def _evict(self):
+        """Tutup ledger yang paling lama tidak dipakai (kecuali yang sedang menulis)."""
+        for name in list(self._ledgers):
+            if len(self._ledgers) <= self.max_open:
+                break
+            lock = self._ledgers[name].lock
+            # Jangan evict ledger yang lock-nya dipegang ATAU sedang ditunggu coroutine lain:
+            # ledger baru untuk nama yang sama = lock kedua = dua penulis sekaligus
+            if lock.locked() or lock._waiters:
+                continue
+            logging.info(f"♻️ Evict ledger '{name}' dari pool.")
+            del self._ledgers[name]
+
+    def lock_for(self, user_id=None):
+        """Lock tulis untuk ledger milik user."""
+        return self._get_ledger(user_id).lock
+
+    def _get_client(self):
+        """Client gspread (otorisasi service account sekali saja, blocking)."""
+        with self._client_lock:
+            if self._client is None:
+                self._client = gspread.service_account(filename=CREDENTIALS_FILE)
+            return self._client
+
+    def _open_worksheet(self, name):
+        """Buka spreadsheet `name` & worksheet pertamanya lewat client bersama (blocking)."""
+        spreadsheet = self._get_client().open(name)
+        return spreadsheet, spreadsheet.sheet1
+
+    async def get_sheet(self, user_id=None):
+        """Koneksi ke Google Sheets milik user (dibuka sekali lalu disimpan di pool)."""
+        ledger = self._get_ledger(user_id)
+        if ledger.sheet:
+            return ledger.sheet
 
-    async def get_correct_kantong_case(self, new_kantong_name):
-        """Mencari nama kantong yang benar (case-insensitive) dengan caching."""
-        now = time.time()
-        
-        # Gunakan cache jika masih valid
-        if self._kantong_cache and (now - self._cache_time < self.CACHE_TTL):
-            corrected_name = self._kantong_cache.get(new_kantong_name.lower())
+        async with ledger.lock:
+            if ledger.sheet:
+                return ledger.sheet
+            try:
+                ledger.spreadsheet, ledger.sheet = await asyncio.to_thread(self._open_worksheet, ledger.name)
+                return ledger.sheet
+            except Exception as e:
+                logging.error(f"Gagal koneksi Sheets '{ledger.name}': {e}")
+                return None
+
+    async def get_correct_kantong_case(self, new_kantong_name, user_id=None):
+        """Mencari nama kantong yang benar (case-insensitive) dengan cache bersama per ledger."""
+        ledger = self._get_ledger(user_id)
+        cache_key = f"kantong:{ledger.name}"
+
+        # Gunakan cache (state store, dipakai bersama semua worker) jika masih valid
+        kantong_cache = await state_store.get_json(cache_key)
+        if kantong_cache:
+            corrected_name = kantong_cache.get(new_kantong_name.lower())
             return corrected_name if corrected_name else new_kantong_name.title()
 
         # Jika cache expired atau belum ada, ambil dari Sheets
-        wks = self.get_sheet()
+        wks = await self.get_sheet(user_id)
         if not wks:
             return new_kantong_name.title()
-            
+
         try:
-            logging.info("🔄 Refreshing kantong cache from GSheets...")
+            logging.info(f"🔄 Refreshing kantong cache from GSheets ({ledger.name})...")
             # Asumsi kolom 'kantong' adalah kolom ke-4
             all_kantong_values = await asyncio.to_thread(wks.col_values, 4)
-            
+
             # Buat set unik dan mapping lowercase -> original case
             existing_kantongs = set(all_kantong_values[1:])
-            self._kantong_cache = {k.lower(): k for k in existing_kantongs if k}
-            self._cache_time = now
-            
-            corrected_name = self._kantong_cache.get(new_kantong_name.lower())
+            kantong_cache = {k.lower(): k for k in existing_kantongs if k}
+            await state_store.set_json(cache_key, kantong_cache, self.CACHE_TTL)
+
+            corrected_name = kantong_cache.get(new_kantong_name.lower())
             return corrected_name if corrected_name else new_kantong_name.title()
-                
+
         except Exception as e:
             logging.error(f"Gagal get/correct kantong case: {e}")
             return new_kantong_name.title()
 
+    async def load_ledger_df(self, user_id=None, fresh=False):
+        """
+        (DataFrame, kolom nominal) ledger user, sudah di-normalisasi (utils.schema).
+        Di-cache per ledger; versi di state store naik setiap penulisan bot sehingga cache
+        semua worker otomatis basi. Edit manual di Sheets baru terlihat setelah
+        LEDGER_CACHE_TTL, jadi jalur yang menulis berdasarkan data ini harus memakai
+        `fresh=True` (selalu download ulang). Kembalikan None jika koneksi gagal.
+        """
+        ledger = self._get_ledger(user_id)
+        wks = await self.get_sheet(user_id)
+        if not wks:
+            return None
+
+        # Baca versi SEBELUM download: penulisan di tengah download membuat cache basi
+        version = await state_store.get_version(ledger.name)
+        if (not fresh and ledger.frame is not None and ledger.frame_version == version
+                and time.time() - ledger.frame_time < LEDGER_CACHE_TTL):
+            return ledger.frame
+
+        frame = await asyncio.to_thread(load_ledger, wks)
+        ledger.frame, ledger.frame_version, ledger.frame_time = frame, version, time.time()
+        return frame
+
+    async def mark_dirty(self, user_id=None):
+        """Tandai data ledger berubah (invalidate cache DataFrame di semua worker)."""
+        ledger = self._get_ledger(user_id)
+        ledger.frame = None
+        await state_store.bump_version(ledger.name)
+
+    async def record_append(self, user_id, response, names):
+        """Simpan range baris hasil append + nama item tiap baris (untuk verifikasi undo)."""
+        await self.mark_dirty(user_id)
+        rows = parse_updated_rows(response)
+        if rows and rows[1] - rows[0] + 1 == len(names):
+            await state_store.push_undo(user_id, self.ledger_name_for(user_id), rows[0], rows[1], names)
+
 # Instance global untuk memudahkan pemakaian
 sheets_service = SheetsService()
@@ -0,0 +1,230 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from config.settings import STATE_DB
+
+class StateStore:
+    """
+    State bersama antar worker uvicorn (SQLite lokal, mode WAL).
+    Menyimpan cache kantong, versi data ledger, kunci dedupe, undo stack, lease leader,
+    dan outbox notifikasi (dikirim oleh leader saja).
+    """
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        self._init_db()
+
+    def _conn(self):
+        """Satu koneksi per thread (asyncio.to_thread memakai banyak thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY, value TEXT, expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS undo_stack (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT, ledger TEXT, start_row INTEGER, end_row INTEGER, label TEXT, names TEXT
+            );
+            CREATE TABLE IF NOT EXISTS versions (
+                name TEXT PRIMARY KEY, version INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY, owner TEXT, expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT, text TEXT, parse_mode TEXT
+            );
+        """)
+
+    # --- Key-Value dengan TTL (cache kantong) ---
+    def _get_json(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_json(self, key, value, ttl):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl)
+        )
+
+    # --- Dedupe ---
+    def _claim(self, key, ttl):
+        """True jika key belum pernah diklaim (dalam TTL), False jika duplikat."""
+        now = time.time()
+        conn = self._conn()
+        # Bersihkan semua key kedaluwarsa (id update/notif tidak pernah berulang)
+        conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, '1', ?)",
+            (key, now + ttl)
+        )
+        return cur.rowcount == 1
+
+    # --- Versi data (invalidasi cache antar worker) ---
+    def _get_version(self, name):
+        row = self._conn().execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump_version(self, name):
+        self._conn().execute(
+            "INSERT INTO versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+            (name,)
+        )
+
+    # --- Undo stack ---
+    def _push_undo(self, user_id, ledger, start_row, end_row, names):
+        self._conn().execute(
+            "INSERT INTO undo_stack (user_id, ledger, start_row, end_row, label, names) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(user_id or ""), ledger, start_row, end_row, ", ".join(names), json.dumps(names))
+        )
+
+    def _peek_undo(self, user_id, ledger):
+        """
+        Entry undo terbaru yang boleh di-undo user: miliknya sendiri atau baris tanpa
+        pemilik (notif MacroDroid tanpa user_id) di ledger yang sama.
+        """
+        row = self._conn().execute(
+            "SELECT id, start_row, end_row, label, names FROM undo_stack "
+            "WHERE user_id IN (?, '') AND ledger = ? ORDER BY id DESC LIMIT 1",
+            (str(user_id or ""), ledger)
+        ).fetchone()
+        if not row:
+            return None
+        entry_id, start_row, end_row, label, names = row
+        return {
+            "id": entry_id, "start_row": start_row, "end_row": end_row,
+            "label": label, "names": json.loads(names) if names else None
+        }
+
+    def _discard_undo(self, entry_id):
+        self._conn().execute("DELETE FROM undo_stack WHERE id = ?", (entry_id,))
+
+    def _rows_deleted(self, ledger, start_row, end_row, entry_id=None):
+        """
+        Sesuaikan stack setelah baris start_row..end_row dihapus dari sheet.
+        Entry `entry_id` (yang di-undo) dibuang; entry lain yang menunjuk baris tsb
+        ditandai hilang (baris 0) agar undo pemiliknya tidak menghapus baris lain;
+        entry di bawahnya digeser ke atas.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if entry_id is not None:
+                conn.execute("DELETE FROM undo_stack WHERE id = ?", (entry_id,))
+            conn.execute(
+                "UPDATE undo_stack SET start_row = 0, end_row = 0 "
+                "WHERE ledger = ? AND start_row > 0 AND start_row <= ? AND end_row >= ?",
+                (ledger, end_row, start_row)
+            )
+            count = end_row - start_row + 1
+            conn.execute(
+                "UPDATE undo_stack SET start_row = start_row - ?, end_row = end_row - ? "
+                "WHERE ledger = ? AND start_row > ?",
+                (count, count, ledger, end_row)
+            )
+
+    def _clear_undo(self, ledger):
+        self._conn().execute("DELETE FROM undo_stack WHERE ledger = ?", (ledger,))
+
+    # --- Leader election (lease) ---
+    def _acquire_lease(self, name, owner, ttl):
+        """Ambil/perpanjang lease. True jika `owner` sekarang pemegang lease."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+            (name, owner, now + ttl, now)
+        )
+        row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        return bool(row and row[0] == owner)
+
+    def _release_lease(self, name, owner):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    # --- Outbox notifikasi (semua worker menulis, leader mengirim) ---
+    def _push_outbox(self, chat_id, text, parse_mode):
+        self._conn().execute(
+            "INSERT INTO outbox (chat_id, text, parse_mode) VALUES (?, ?, ?)",
+            (str(chat_id), text, parse_mode)
+        )
+
+    def _pop_outbox(self, limit):
+        """Ambil & hapus hingga `limit` pesan tertua (atomik, aman jika 2 leader sempat tumpang tindih)."""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, chat_id, text, parse_mode FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                conn.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+        return [(chat_id, text, parse_mode) for _, chat_id, text, parse_mode in rows]
+
+    # --- API async (SQLite blocking -> thread) ---
+    async def get_json(self, key):
+        return await asyncio.to_thread(self._get_json, key)
+
+    async def set_json(self, key, value, ttl):
+        await asyncio.to_thread(self._set_json, key, value, ttl)
+
+    async def claim(self, key, ttl=3600):
+        try:
+            return await asyncio.to_thread(self._claim, key, ttl)
+        except Exception as e:
+            # Jangan sampai store bermasalah membuat update hilang
+            logging.error(f"Gagal cek dedupe '{key}': {e}")
+            return True
+
+    async def get_version(self, name):
+        return await asyncio.to_thread(self._get_version, name)
+
+    async def bump_version(self, name):
+        await asyncio.to_thread(self._bump_version, name)
+
+    async def push_undo(self, user_id, ledger, start_row, end_row, names):
+        await asyncio.to_thread(self._push_undo, user_id, ledger, start_row, end_row, names)
+
+    async def peek_undo(self, user_id, ledger):
+        return await asyncio.to_thread(self._peek_undo, user_id, ledger)
+
+    async def discard_undo(self, entry_id):
+        await asyncio.to_thread(self._discard_undo, entry_id)
+
+    async def rows_deleted(self, ledger, start_row, end_row, entry_id=None):
+        await asyncio.to_thread(self._rows_deleted, ledger, start_row, end_row, entry_id)
+
+    async def clear_undo(self, ledger):
+        await asyncio.to_thread(self._clear_undo, ledger)
+
+    async def push_outbox(self, chat_id, text, parse_mode):
+        await asyncio.to_thread(self._push_outbox, chat_id, text, parse_mode)
+
+    async def pop_outbox(self, limit=100):
+        return await asyncio.to_thread(self._pop_outbox, limit)
+
+    async def acquire_lease(self, name, owner, ttl):
+        return await asyncio.to_thread(self._acquire_lease, name, owner, ttl)
+
+    async def release_lease(self, name, owner):
+        await asyncio.to_thread(self._release_lease, name, owner)
+
+# Instance global
+state_store = StateStore()
@@ -2,23 +2,59 @@ import json
 import asyncio
 import logging
 from datetime import datetime
+from config.settings import AI_STREAMING
 from services.sheets_service import sheets_service
 from services.ai_service import ai_service
-from utils.helpers import clean_for_json
+from utils.schema import to_ledger_row
+from utils.json_stream import TransaksiStreamParser
 
-async def core_process_transaction(text_input, media_path=None, source_info="User Input"):
+async def build_transaction_row(item, user_id=None):
+    """Ubah satu item transaksi dari AI menjadi (baris sheet, baris laporan)."""
+    raw_kantong = item.get('kantong', 'Tunai')
+    corrected_kantong = await sheets_service.get_correct_kantong_case(raw_kantong, user_id)
+
+    item['kantong'] = corrected_kantong
+    row = to_ledger_row(item)  # Sudah bertipe native, siap append
+
+    arrow = "➡️" if item.get('tipe') == 'Keluar' else "⬅️"
+    line = f"{arrow} {item.get('kantong')}: Rp {row[9]:,} ({item.get('nama')})"
+    return row, line
+
+async def core_process_transaction(text_input, media_path=None, source_info="User Input", user_id=None, on_item=None):
     """
     Logika Inti: Terima teks/gambar -> AI -> JSON -> Sheets.
+    `user_id` menentukan ledger tujuan (lihat USER_SHEETS), None = ledger default.
+    `on_item(line)` (opsional, butuh AI_STREAMING) dipanggil untuk tiap item yang
+    sudah ter-parse selagi respons AI masih di-stream; `on_item(None)` berarti progres
+    di-reset (provider berganti). Semua baris tetap di-append sekali di akhir.
     Mengembalikan text laporan hasil untuk dikirim ke user.
     """
     # --- DEBUG INPUT ---
-    logging.info(f"📥 Incoming Transaction Text: '{text_input}'")
+    logging.info("📥 Incoming Transaction Text (%d chars): %r", len(text_input), text_input)
     
     try:
-        final_json_text, used_ai = await ai_service.smart_ai_processing(text_input, media_path)
+        staged = []  # (row, line) hasil streaming, siap di-append di akhir
+        on_chunk = None
+        if on_item and AI_STREAMING:
+            parser = TransaksiStreamParser()
+
+            async def on_chunk(chunk):
+                if chunk is None:
+                    # Provider berganti, stream dimulai ulang
+                    parser.reset()
+                    staged.clear()
+                    await on_item(None)
+                    return
+                for item in parser.feed(chunk):
+                    row, line = await build_transaction_row(item, user_id)
+                    staged.append((row, line))
+                    await on_item(line)
+
+        final_json_text, used_ai = await ai_service.smart_ai_processing(text_input, media_path, on_chunk)
         
         # --- DEBUG AI RESPONSE ---
-        logging.info(f"🤖 AI Raw Response ({used_ai}): '{final_json_text}'")
+        logging.info("🤖 AI Response (%s): %d chars", used_ai, len(final_json_text or ""))
+        logging.debug("🤖 AI Raw Response (%s): %r", used_ai, final_json_text)
         
         if not final_json_text:
             return "🤔 Maaf, saya tidak dapat memproses input tersebut."
@@ -34,33 +70,23 @@ async def core_process_transaction(text_input, media_path=None, source_info="Use
                 return ""
             return "🤔 Maaf, saya tidak dapat menemukan detail transaksi dari data tersebut."
 
-        wks = sheets_service.get_sheet()
+        wks = await sheets_service.get_sheet(user_id)
         if not wks:
             return "❌ Koneksi database putus."
 
-        rows = []
+        # Pakai hasil streaming jika lengkap, selain itu bangun ulang dari JSON final
+        if len(staged) != len(data_list):
+            staged = [await build_transaction_row(item, user_id) for item in data_list]
+
+        rows = [row for row, _ in staged]
         report_text = f"✅ **Tersimpan!** (via {used_ai} | {source_info})\n"
-        
-        for item in data_list:
-            raw_kantong = item.get('kantong', 'Tunai')
-            corrected_kantong = await sheets_service.get_correct_kantong_case(raw_kantong)
-            
-            item['kantong'] = corrected_kantong
-            
-            row = [
-                item.get('tanggal'), item.get('jam'), item.get('tipe'),
-                corrected_kantong, item.get('nama'), item.get('satuan', 'x'),
-                item.get('volume', 1), item.get('harga_satuan', 0),
-                item.get('kategori'), item.get('harga_total', 0)
-            ]
-            
-            rows.append(clean_for_json(row))
-            
-            arrow = "➡️" if item.get('tipe') == 'Keluar' else "⬅️"
-            report_text += f"\n{arrow} {item.get('kantong')}: Rp {item.get('harga_total'):,} ({item.get('nama')})"
+        for _, line in staged:
+            report_text += f"\n{line}"
 
         if rows:
-            await asyncio.to_thread(wks.append_rows, rows)
+            async with sheets_service.lock_for(user_id):
+                response = await asyncio.to_thread(wks.append_rows, rows)
+                await sheets_service.record_append(user_id, response, names=[str(r[4]) for r in rows])
         
         return report_text
 
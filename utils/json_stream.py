@@ -0,0 +1,73 @@
+import json
+
+class TransaksiStreamParser:
+    """
+    Parser JSON inkremental untuk array `transaksi` dari respons AI yang di-stream.
+    Setiap objek transaksi dikembalikan begitu kurung kurawalnya tertutup,
+    tanpa menunggu seluruh respons selesai.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._depth = 0          # Kedalaman {} / [] di dalam array transaksi
+        self._item_start = None  # Posisi awal objek yang sedang dibaca
+
+    def feed(self, chunk):
+        """Tambah potongan teks, kembalikan list item (dict) yang baru lengkap."""
+        if self._done:
+            return []
+        self._buffer += chunk
+        items = []
+        buf = self._buffer
+
+        while self._pos < len(buf):
+            ch = buf[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif not self._in_array:
+                # Array pertama di luar string = array transaksi
+                # (baik {"transaksi": [...]} maupun array polos)
+                if ch == "[":
+                    self._in_array = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._item_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Array transaksi selesai, sisa teks diabaikan
+                    self._done = True
+                    self._buffer = ""
+                    return items
+                self._depth -= 1
+                if self._depth == 0 and self._item_start is not None:
+                    try:
+                        items.append(json.loads(buf[self._item_start:self._pos + 1]))
+                    except ValueError:
+                        pass
+                    self._item_start = None
+
+            self._pos += 1
+
+        # Buang teks yang sudah tidak dibutuhkan agar buffer tetap kecil
+        keep_from = self._item_start if self._item_start is not None else self._pos
+        self._buffer = buf[keep_from:]
+        self._pos -= keep_from
+        if self._item_start is not None:
+            self._item_start = 0
+        return items
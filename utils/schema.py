@@ -0,0 +1,101 @@
+import re
+import math
+import numbers
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# Urutan kolom di Google Sheets (A-J)
+LEDGER_COLUMNS = [
+    "tanggal", "jam", "tipe", "kantong", "nama",
+    "satuan", "volume", "harga_satuan", "kategori", "harga_total"
+]
+CATEGORICAL_COLUMNS = ["tipe", "kantong", "kategori", "satuan"]
+
+@lru_cache(maxsize=32)
+def resolve_amount_column(columns):
+    """Cari kolom nominal (total/amount/harga, bukan harga satuan) dari tuple nama kolom."""
+    return next((c for c in columns if ('total' in c or 'amount' in c or 'harga' in c) and 'satuan' not in c), None)
+
+def parse_amount(series):
+    """Kolom nominal -> float. Angka langsung dipakai, hanya teks (cth 'Rp 15.000') yang dibersihkan regex."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64').fillna(0)
+
+    values = series.to_numpy(dtype=object)
+    is_text = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    result = np.zeros(len(values), dtype='float64')
+    if (~is_text).any():
+        result[~is_text] = pd.to_numeric(pd.Series(values[~is_text]), errors='coerce').to_numpy(dtype='float64')
+    if is_text.any():
+        cleaned = pd.Series(values[is_text], dtype=object).str.replace(r'[^\d-]', '', regex=True)
+        result[is_text] = pd.to_numeric(cleaned, errors='coerce').to_numpy(dtype='float64')
+    return pd.Series(result, index=series.index).fillna(0)
+
+def normalize_ledger(records):
+    """
+    Data mentah `get_all_records` -> (DataFrame, nama kolom nominal).
+    Kolom di-resolve sekali, nominal/tanggal/kategori di-parse dalam satu pass vektor.
+    """
+    df = pd.DataFrame(records)
+    df.columns = [str(c).lower().strip() for c in df.columns]
+
+    col_harga = resolve_amount_column(tuple(df.columns))
+    if col_harga:
+        df[col_harga] = parse_amount(df[col_harga])
+    if 'tanggal' in df.columns:
+        df['tanggal'] = pd.to_datetime(df['tanggal'], errors='coerce')
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    return df, col_harga
+
+def load_ledger(wks):
+    """Download worksheet lalu normalisasi (blocking, panggil via asyncio.to_thread)."""
+    return normalize_ledger(wks.get_all_records())
+
+def hitung_saldo(df, col_harga):
+    """Saldo (masuk - keluar) per kantong sebagai Series, urut sesuai kemunculan kantong."""
+    if df.empty or not col_harga or 'kantong' not in df.columns or 'tipe' not in df.columns:
+        return pd.Series(dtype='float64')
+
+    # Tanda +/- dihitung per kategori unik, lalu disebar lewat kode kategori
+    tipe = df['tipe'].astype('category')
+    signs = [1.0 if str(t).lower() == 'masuk' else -1.0 if str(t).lower() == 'keluar' else 0.0
+             for t in tipe.cat.categories]
+    lookup = np.array(signs + [0.0])  # Kode -1 (NaN) -> elemen terakhir = 0
+    sign = lookup[tipe.cat.codes.to_numpy()]
+
+    signed = df[col_harga].to_numpy() * sign
+    return pd.Series(signed, index=df.index).groupby(df['kantong'], observed=True, sort=False).sum()
+
+def _to_number(value):
+    """Nilai nominal/volume dari AI -> int/float Python native. Teks dibersihkan seperti parse_amount."""
+    if value is None:
+        return 0
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isfinite(value):
+            return 0
+        return int(value) if value.is_integer() else value
+    # Teks (cth "15.000" / "Rp 15.000"): titik adalah pemisah ribuan, bukan desimal
+    digits = re.sub(r'[^\d-]', '', str(value))
+    try:
+        return int(digits)
+    except ValueError:
+        return 0
+
+def _to_text(value):
+    return "" if value is None else str(value)
+
+def to_ledger_row(item):
+    """Dict transaksi dari AI -> baris sheet (urut LEDGER_COLUMNS) dengan tipe native."""
+    return [
+        _to_text(item.get('tanggal')), _to_text(item.get('jam')), _to_text(item.get('tipe')),
+        _to_text(item.get('kantong')), _to_text(item.get('nama')), _to_text(item.get('satuan', 'x')),
+        _to_number(item.get('volume', 1)), _to_number(item.get('harga_satuan', 0)),
+        _to_text(item.get('kategori')), _to_number(item.get('harga_total', 0))
+    ]